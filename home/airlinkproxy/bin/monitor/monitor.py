@@ -8,6 +8,8 @@ Read from airlink sensor every 5 seconds and write current reading.
 At 5s past the minute, write an archive reading.
 """
 
+import configparser
+import operator
 import optparse
 import os
 import requests
@@ -15,23 +17,36 @@ import sqlite3
 import sys
 import syslog
 import tempfile
+import threading
 import time
 import traceback
+import zlib
 
 import server.server
 
-import configobj
-
-from datetime import datetime
-from dateutil import tz
-from dateutil.parser import parse
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from contextlib import contextmanager
 from enum import Enum
-from json import dumps
 from time import sleep
 
 from dataclasses import dataclass
 from typing import Any, Dict, Iterator, Optional, Tuple
 
+# Use orjson (a C extension, ~5x faster) when it is installed; fall back
+# to the stdlib json module.  Either way dumps returns str, dumps_bytes
+# returns utf-8 bytes, and loads accepts str or bytes.
+try:
+    import orjson
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+    dumps_bytes = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+    from json import dumps, loads
+    def dumps_bytes(obj: Any) -> bytes:
+        return dumps(obj).encode('utf-8')
+
 AIRLINK_PROXY_VERSION = "0.1"
 
 class Logger(object):
@@ -59,9 +74,11 @@ class Logger(object):
         else:
             syslog.syslog(level, msg)
 
-    def debug(self, msg: str) -> None:
+    def debug(self, msg: str, *args: Any) -> None:
+        # Formatting is deferred until after the debug_mode check so
+        # callers pay nothing when debug is off.
         if self.debug_mode:
-            self.logmsg(syslog.LOG_DEBUG, msg)
+            self.logmsg(syslog.LOG_DEBUG, msg % args if args else msg)
 
     def info(self, msg: str) -> None:
         self.logmsg(syslog.LOG_INFO, msg)
@@ -81,7 +98,9 @@ class Event(Enum):
 
 #{ "data": { "did": "001D0A100214", "name": "paloaltoweather.com", "ts": 1600657321, "conditions": [{ "lsid": 347825, "data_structure_type": 6, "temp": 74.1, "hum": 62.8, "dew_point": 60.6, "wet_bulb": 64.2, "heat_index": 74.7, "pm_1_last": 11, "pm_2p5_last": 14, "pm_10_last": 17, "pm_1": 11.68, "pm_2p5": 15.55, "pm_2p5_last_1_hour": 19.35, "pm_2p5_last_3_hours": 20.54, "pm_2p5_last_24_hours": 18.59, "pm_2p5_nowcast": 21.25, "pm_10": 17.28, "pm_10_last_1_hour": 23.30, "pm_10_last_3_hours": 24.64, "pm_10_last_24_hours": 22.71, "pm_10_nowcast": 25.60, "last_report_time": 1600657321, "pct_pm_data_last_1_hour": 100, "pct_pm_data_last_3_hours": 100, "pct_pm_data_nowcast": 100, "pct_pm_data_last_24_hours": 100 }] }, "error": null }
 
-@dataclass
+# slots=True drops the per-instance __dict__; with 29 fields that is a
+# sizable per-row saving when many archive readings are materialized.
+@dataclass(slots=True)
 class Reading:
     did                      : str
     name                     : str
@@ -120,9 +139,183 @@ class RecordType:
     CURRENT: int = 0
     ARCHIVE: int = 1
 
+# Schema shared by the Reading table and its hourly downsample,
+# ReadingHourly.
+CREATE_TABLE_SQL: str = ('CREATE TABLE IF NOT EXISTS %s ('
+    ' record_type               INTEGER NOT NULL,'
+    ' timestamp                 INTEGER NOT NULL,'
+    ' did                       STRING,'
+    ' name                      STRING,'
+    ' ts                        INTEGER,'
+    ' lsid                      INTEGER,'
+    ' data_structure_type       INTEGER,'
+    ' temp                      FLOAT,'
+    ' hum                       FLOAT,'
+    ' dew_point                 FLOAT,'
+    ' wet_bulb                  FLOAT,'
+    ' heat_index                FLOAT,'
+    ' pm_1_last                 INTEGER,'
+    ' pm_2p5_last               INTEGER,'
+    ' pm_10_last                INTEGER,'
+    ' pm_1                      FLOAT,'
+    ' pm_2p5                    FLOAT,'
+    ' pm_2p5_last_1_hour        FLOAT,'
+    ' pm_2p5_last_3_hours       FLOAT,'
+    ' pm_2p5_last_24_hours      FLOAT,'
+    ' pm_2p5_nowcast            FLOAT,'
+    ' pm_10                     FLOAT,'
+    ' pm_10_last_1_hour         FLOAT,'
+    ' pm_10_last_3_hours        FLOAT,'
+    ' pm_10_last_24_hours       FLOAT,'
+    ' pm_10_nowcast             FLOAT,'
+    ' last_report_time          INTEGER,'
+    ' pct_pm_data_last_1_hour   INTEGER,'
+    ' pct_pm_data_last_3_hours  INTEGER,'
+    ' pct_pm_data_nowcast       INTEGER,'
+    ' pct_pm_data_last_24_hours INTEGER,'
+    ' PRIMARY KEY (record_type, timestamp)) WITHOUT ROWID;')
+
+# Whole days of archive readings can be packed into one compressed
+# column-oriented blob per day (timestamps stored as offsets from
+# day_start).  Time-series columns compress very well, so this cuts the
+# disk taken by cold history by an order of magnitude.
+CREATE_COMPRESSED_TABLE_SQL: str = ('CREATE TABLE IF NOT EXISTS ReadingCompressed ('
+    ' day_start INTEGER NOT NULL,'
+    ' data      BLOB NOT NULL,'
+    ' PRIMARY KEY (day_start)) WITHOUT ROWID;')
+
+# The Reading fields in declaration order.  The first three belong to the
+# 'data' object of the json representation; the rest to conditions[0].
+READING_FIELDS: Tuple[str, ...] = (
+    'did', 'name', 'ts', 'lsid', 'data_structure_type',
+    'temp', 'hum', 'dew_point', 'wet_bulb', 'heat_index',
+    'pm_1_last', 'pm_2p5_last', 'pm_10_last',
+    'pm_1',
+    'pm_2p5', 'pm_2p5_last_1_hour', 'pm_2p5_last_3_hours', 'pm_2p5_last_24_hours', 'pm_2p5_nowcast',
+    'pm_10', 'pm_10_last_1_hour', 'pm_10_last_3_hours', 'pm_10_last_24_hours', 'pm_10_nowcast',
+    'last_report_time', 'pct_pm_data_last_1_hour', 'pct_pm_data_last_3_hours',
+    'pct_pm_data_nowcast', 'pct_pm_data_last_24_hours')
+
+# Pulls all 29 fields out of a Reading in one C-level call.
+READING_ATTRS = operator.attrgetter(*READING_FIELDS)
+
+# Pull the Reading fields out of a sensor response's data object and
+# conditions[0] dict in two C-level calls.
+DATA_GET = operator.itemgetter(*READING_FIELDS[:3])
+COND_GET = operator.itemgetter(*READING_FIELDS[3:])
+
+# Sentinel to distinguish a missing key from a key present with None.
+MISSING: Any = object()
+
+# (field, type, none_ok) triples checked by is_sane against
+# conditions[0], hoisted to module scope so the lists aren't rebuilt on
+# every poll.
+SANE_CONDITION_FIELDS: Tuple[Tuple[str, type, bool], ...] = (
+    ('lsid',                      int,   True),
+    ('temp',                      float, False),
+    ('hum',                       float, False),
+    ('dew_point',                 float, False),
+    ('wet_bulb',                  float, False),
+    ('heat_index',                float, False),
+    ('pm_1_last',                 int,   True),
+    ('pm_2p5_last',               int,   True),
+    ('pm_10_last',                int,   True),
+    ('pm_1',                      float, True),
+    ('pm_2p5',                    float, True),
+    ('pm_2p5_last_1_hour',        float, True),
+    ('pm_2p5_last_3_hours',       float, True),
+    ('pm_2p5_last_24_hours',      float, True),
+    ('pm_2p5_nowcast',            float, True),
+    ('pm_10',                     float, True),
+    ('pm_10_last_1_hour',         float, True),
+    ('pm_10_last_3_hours',        float, True),
+    ('pm_10_last_24_hours',       float, True),
+    ('pm_10_nowcast',             float, True),
+    ('last_report_time',          int,   True),
+    ('pct_pm_data_last_1_hour',   int,   True),
+    ('pct_pm_data_last_3_hours',  int,   True),
+    ('pct_pm_data_nowcast',       int,   True),
+    ('pct_pm_data_last_24_hours', int,   True))
+
+# One prepared statement (31 columns: record_type, timestamp plus the 29
+# Reading fields, in declaration order).  SQLite binds the values itself,
+# so None columns and quoting need no special handling.
+INSERT_SQL: str = ('INSERT INTO Reading (record_type, timestamp, %s)'
+    ' VALUES (%s);' % (', '.join(READING_FIELDS), ', '.join(['?'] * 31)))
+
+# Used for the current reading, which lives in a single fixed primary-key
+# slot (record_type CURRENT, timestamp 0); REPLACE overwrites it in one
+# statement instead of a DELETE plus an INSERT.
+REPLACE_SQL: str = INSERT_SQL.replace('INSERT', 'INSERT OR REPLACE', 1)
+
+# Probe used by the current-conditions serialization cache: fetching
+# just ts is far cheaper than rebuilding the full JSON payload.
+CURRENT_TS_SQL: str = ('SELECT ts FROM Reading WHERE record_type = %d'
+    ' AND timestamp = 0;' % RecordType.CURRENT)
+
+# How each Reading field is aggregated when downsampling to hourly
+# records.  Fields not listed are averaged.
+HOURLY_AGGREGATES: Dict[str, str] = {
+    'did'                : 'did',
+    'name'               : 'name',
+    'ts'                 : 'MAX(ts)',
+    'lsid'               : 'lsid',
+    'data_structure_type': 'data_structure_type',
+    'last_report_time'   : 'MAX(last_report_time)'}
+
 class Database(object):
     def __init__(self, db_file: str):
         self.db_file = db_file
+        # Opening a connection is expensive (file open, journal setup,
+        # schema lookup); do it once and reuse it.  The lock serializes
+        # use of the connection across threads.
+        self.conn = sqlite3.connect(db_file, timeout=15, check_same_thread=False)
+        # Reentrant so that saves can run inside a transaction() block.
+        self.lock = threading.RLock()
+        self.in_transaction = False
+        # Tune the connection.  WAL mode does one fsync per commit (the
+        # default rollback journal does two) and lets the HTTP server
+        # read while the monitor writes.  journal_mode persists in the
+        # database file; the other pragmas are per-connection.
+        cursor = self.conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL;')
+        cursor.execute('PRAGMA synchronous=NORMAL;')
+        cursor.execute('PRAGMA temp_store=MEMORY;')
+        cursor.execute('PRAGMA cache_size=-8192;')
+        cursor.execute('PRAGMA mmap_size=67108864;')
+        # Databases written before the current reading moved to the
+        # fixed (record_type, timestamp) = (CURRENT, 0) slot left the
+        # old current row at its reading timestamp; clear any such
+        # legacy row once so fetches see a single current reading.
+        try:
+            cursor.execute('DELETE FROM Reading WHERE record_type = %d'
+                ' AND timestamp != 0;' % RecordType.CURRENT)
+            self.conn.commit()
+        except sqlite3.OperationalError:
+            # The table doesn't exist yet (fresh in-memory database).
+            pass
+        cursor.close()
+        # (ts, serialized payload) of the last current reading served.
+        self.current_json_cache: Tuple[int, bytes] = (0, b'')
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Group several saves into a single commit (one fsync)."""
+        with self.lock:
+            self.in_transaction = True
+            try:
+                yield
+                self.conn.commit()
+            except Exception:
+                # Drop any partial writes rather than letting a later
+                # commit pick them up.
+                self.conn.rollback()
+                raise
+            finally:
+                self.in_transaction = False
 
     @staticmethod
     def create(db_file): # -> Database:
@@ -134,236 +327,284 @@ class Database(object):
             if not os.path.exists(dir):
                 os.makedirs(dir)
 
-        create_reading_table: str = ('CREATE TABLE Reading ('
-            ' record_type               INTEGER NOT NULL,'
-            ' timestamp                 INTEGER NOT NULL,'
-            ' did                       STRING,'
-            ' name                      STRING,'
-            ' ts                        INTEGER,'
-            ' lsid                      INTEGER,'
-            ' data_structure_type       INTEGER,'
-            ' temp                      FLOAT,'
-            ' hum                       FLOAT,'
-            ' dew_point                 FLOAT,'
-            ' wet_bulb                  FLOAT,'
-            ' heat_index                FLOAT,'
-            ' pm_1_last                 INTEGER,'
-            ' pm_2p5_last               INTEGER,'
-            ' pm_10_last                INTEGER,'
-            ' pm_1                      FLOAT,'
-            ' pm_2p5                    FLOAT,'
-            ' pm_2p5_last_1_hour        FLOAT,'
-            ' pm_2p5_last_3_hours       FLOAT,'
-            ' pm_2p5_last_24_hours      FLOAT,'
-            ' pm_2p5_nowcast            FLOAT,'
-            ' pm_10                     FLOAT,'
-            ' pm_10_last_1_hour         FLOAT,'
-            ' pm_10_last_3_hours        FLOAT,'
-            ' pm_10_last_24_hours       FLOAT,'
-            ' pm_10_nowcast             FLOAT,'
-            ' last_report_time          INTEGER,'
-            ' pct_pm_data_last_1_hour   INTEGER,'
-            ' pct_pm_data_last_3_hours  INTEGER,'
-            ' pct_pm_data_nowcast       INTEGER,'
-            ' pct_pm_data_last_24_hours INTEGER,'
-            ' PRIMARY KEY (record_type, timestamp));')
-
         with sqlite3.connect(db_file, timeout=10) as conn:
             cursor = conn.cursor()
-            cursor.execute(create_reading_table)
+            cursor.execute(CREATE_TABLE_SQL % 'Reading')
+            cursor.execute(CREATE_TABLE_SQL % 'ReadingHourly')
+            cursor.execute(CREATE_COMPRESSED_TABLE_SQL)
             cursor.close()
 
         return Database(db_file)
 
     def save_current_reading(self, r: Reading) -> None:
-        self.save_reading(RecordType.CURRENT, r.ts, r)
+        self.save_reading(RecordType.CURRENT, 0, r)
 
     def save_archive_reading(self, timestamp: int, r: Reading) -> None:
         self.save_reading(RecordType.ARCHIVE, timestamp, r)
 
     @staticmethod
-    def add_string(fields: str, values: str, field: str, str_val: str) -> Tuple[str, str]:
-        if str_val is not None:
-            return '%s, %s' % (fields, field), '%s, "%s"' % (values, str_val)
-
-    @staticmethod
-    def add_int(fields: str, values: str, field: str, int_val: int) -> Tuple[str, str]:
-        if int_val is not None:
-            return '%s, %s' % (fields, field), '%s, %d' % (values, int_val)
-
-    @staticmethod
-    def add_float(fields: str, values: str, field: str, float_val: float) -> Tuple[str, str]:
-        if float_val is not None:
-            return '%s, %s' % (fields, field), '%s, %f' % (values, float_val)
-
-    @staticmethod
-    def build_insert_statement(record_type: int, timestamp: int, r: Reading) -> str:
-        fields: str = 'record_type, timestamp'
-        values: str = '%d, %d' % (record_type, timestamp) 
-        if r.did is not None:
-            fields, values = Database.add_string(fields, values, 'did', r.did)
-        if r.name is not None:
-            fields, values = Database.add_string(fields, values, 'name', r.name)
-        if r.ts is not None:
-            fields, values = Database.add_int(fields, values, 'ts', r.ts)
-        if r.lsid is not None:
-            fields, values = Database.add_int(fields, values, 'lsid', r.lsid)
-        if r.data_structure_type is not None:
-            fields, values = Database.add_int(fields, values, 'data_structure_type', r.data_structure_type)
-        if r.temp is not None:
-            fields, values = Database.add_float(fields, values, 'temp', r.temp)
-        if r.hum is not None:
-            fields, values = Database.add_float(fields, values, 'hum', r.hum)
-        if r.dew_point is not None:
-            fields, values = Database.add_float(fields, values, 'dew_point', r.dew_point)
-        if r.wet_bulb is not None:
-            fields, values = Database.add_float(fields, values, 'wet_bulb', r.wet_bulb)
-        if r.heat_index is not None:
-            fields, values = Database.add_float(fields, values, 'heat_index', r.heat_index)
-        if r.pm_1_last is not None:
-            fields, values = Database.add_int(fields, values, 'pm_1_last', r.pm_1_last)
-        if r.pm_2p5_last is not None:
-            fields, values = Database.add_int(fields, values, 'pm_2p5_last', r.pm_2p5_last)
-        if r.pm_10_last is not None:
-            fields, values = Database.add_int(fields, values, 'pm_10_last', r.pm_10_last)
-        if r.pm_1 is not None:
-            fields, values = Database.add_float(fields, values, 'pm_1', r.pm_1)
-        if r.pm_2p5 is not None:
-            fields, values = Database.add_float(fields, values, 'pm_2p5', r.pm_2p5)
-        if r.pm_2p5_last_1_hour is not None:
-            fields, values = Database.add_float(fields, values, 'pm_2p5_last_1_hour', r.pm_2p5_last_1_hour)
-        if r.pm_2p5_last_3_hours is not None:
-            fields, values = Database.add_float(fields, values, 'pm_2p5_last_3_hours', r.pm_2p5_last_3_hours)
-        if r.pm_2p5_last_24_hours is not None:
-            fields, values = Database.add_float(fields, values, 'pm_2p5_last_24_hours', r.pm_2p5_last_24_hours)
-        if r.pm_2p5_nowcast is not None:
-            fields, values = Database.add_float(fields, values, 'pm_2p5_nowcast', r.pm_2p5_nowcast)
-        if r.pm_10 is not None:
-            fields, values = Database.add_float(fields, values, 'pm_10', r.pm_10)
-        if r.pm_10_last_1_hour is not None:
-            fields, values = Database.add_float(fields, values, 'pm_10_last_1_hour', r.pm_10_last_1_hour)
-        if r.pm_10_last_3_hours is not None:
-            fields, values = Database.add_float(fields, values, 'pm_10_last_3_hours', r.pm_10_last_3_hours)
-        if r.pm_10_last_24_hours is not None:
-            fields, values = Database.add_float(fields, values, 'pm_10_last_24_hours', r.pm_10_last_24_hours)
-        if r.pm_10_nowcast is not None:
-            fields, values = Database.add_float(fields, values, 'pm_10_nowcast', r.pm_10_nowcast)
-        if r.last_report_time is not None:
-            fields, values = Database.add_int(fields, values, 'last_report_time', r.last_report_time)
-        if r.pct_pm_data_last_1_hour is not None:
-            fields, values = Database.add_int(fields, values, 'pct_pm_data_last_1_hour', r.pct_pm_data_last_1_hour)
-        if r.pct_pm_data_last_3_hours is not None:
-            fields, values = Database.add_int(fields, values, 'pct_pm_data_last_3_hours', r.pct_pm_data_last_3_hours)
-        if r.pct_pm_data_nowcast is not None:
-            fields, values = Database.add_int(fields, values, 'pct_pm_data_nowcast', r.pct_pm_data_nowcast)
-        if r.pct_pm_data_last_24_hours is not None:
-            fields, values = Database.add_int(fields, values, 'pct_pm_data_last_24_hours', r.pct_pm_data_last_24_hours)
-
-        return 'INSERT INTO Reading (%s) VALUES(%s);' % (fields, values)
+    def reading_to_tuple(record_type: int, timestamp: int, r: Reading) -> Tuple:
+        return (record_type, timestamp) + READING_ATTRS(r)
 
     def save_reading(self, record_type: int, timestamp: int, r: Reading) -> None:
-        insert_reading_sql = Database.build_insert_statement(record_type, timestamp, r)
-        with sqlite3.connect(self.db_file, timeout=15) as conn:
-            cursor = conn.cursor()
-            # if a current record, delete previous current.
+        values: Tuple = Database.reading_to_tuple(record_type, timestamp, r)
+        with self.lock:
+            cursor = self.conn.cursor()
+            log.debug('inserting record: %r', values)
+            # A current record replaces the previous current in place.
             if record_type == RecordType.CURRENT:
-                cursor.execute('DELETE FROM Reading where record_type = %d;' % RecordType.CURRENT)
-            # Now insert.
-            log.debug('inserting record: %s' % insert_reading_sql)
-            cursor.execute(insert_reading_sql)
+                cursor.execute(REPLACE_SQL, values)
+                self.current_json_cache = (0, b'')
+            else:
+                cursor.execute(INSERT_SQL, values)
+            if not self.in_transaction:
+                self.conn.commit()
+            cursor.close()
 
-    def fetch_current_readings(self) -> Iterator[Reading]:
-        return self.fetch_readings(RecordType.CURRENT, 0)
+    def downsample(self, older_than_ts: int) -> int:
+        """Fold archive readings older than older_than_ts into hourly
+        records in ReadingHourly and delete the raw rows.  Returns the
+        number of raw rows deleted."""
+        # Only fold whole hours (as compress only packs whole days).  A
+        # mid-hour cutoff would aggregate part of the hour, and the next
+        # run's INSERT OR IGNORE would drop the rest of that hour's rows
+        # on the floor: the bucket already exists, but the delete below
+        # removes the raw rows anyway.
+        older_than_ts -= older_than_ts % 3600
+        columns: str = ', '.join(
+            HOURLY_AGGREGATES.get(field, 'AVG(%s)' % field) for field in READING_FIELDS)
+        insert: str = ('INSERT OR IGNORE INTO ReadingHourly'
+            ' SELECT record_type, (timestamp / 3600) * 3600 AS bucket, %s'
+            ' FROM Reading WHERE record_type = %d AND timestamp < %d'
+            ' GROUP BY bucket;' % (columns, RecordType.ARCHIVE, older_than_ts))
+        delete: str = ('DELETE FROM Reading WHERE record_type = %d AND timestamp < %d;'
+            % (RecordType.ARCHIVE, older_than_ts))
+        with self.lock:
+            cursor = self.conn.cursor()
+            # Databases created before ReadingHourly existed need the table.
+            cursor.execute(CREATE_TABLE_SQL % 'ReadingHourly')
+            cursor.execute(insert)
+            cursor.execute(delete)
+            deleted: int = cursor.rowcount
+            self.conn.commit()
+            cursor.close()
+        return deleted
+
+    def compress(self, older_than_ts: int) -> int:
+        """Pack whole days of archive readings older than older_than_ts
+        into one compressed column-oriented blob per day and delete the
+        raw rows.  Returns the number of days packed."""
+        cutoff_day: int = int(older_than_ts / 86400) * 86400
+        packed_days: int = 0
+        with self.lock:
+            cursor = self.conn.cursor()
+            # Databases created before ReadingCompressed existed need the table.
+            cursor.execute(CREATE_COMPRESSED_TABLE_SQL)
+            days = [row[0] for row in cursor.execute(
+                'SELECT DISTINCT (timestamp / 86400) * 86400 FROM Reading'
+                ' WHERE record_type = %d AND timestamp < %d;'
+                % (RecordType.ARCHIVE, cutoff_day)).fetchall()]
+            for day_start in days:
+                rows = cursor.execute(
+                    'SELECT timestamp, %s FROM Reading'
+                    ' WHERE record_type = %d AND timestamp >= %d AND timestamp < %d'
+                    ' ORDER BY timestamp;'
+                    % (', '.join(READING_FIELDS), RecordType.ARCHIVE,
+                       day_start, day_start + 86400)).fetchall()
+                columns: Dict[str, list] = {
+                    'timestamp': [row[0] - day_start for row in rows]}
+                for i, field in enumerate(READING_FIELDS):
+                    columns[field] = [row[i + 1] for row in rows]
+                blob = zlib.compress(dumps(columns).encode('utf-8'))
+                cursor.execute(
+                    'INSERT OR REPLACE INTO ReadingCompressed (day_start, data)'
+                    ' VALUES (?, ?);', (day_start, blob))
+                cursor.execute(
+                    'DELETE FROM Reading WHERE record_type = %d'
+                    ' AND timestamp >= %d AND timestamp < %d;'
+                    % (RecordType.ARCHIVE, day_start, day_start + 86400))
+                packed_days += 1
+            self.conn.commit()
+            cursor.close()
+        return packed_days
 
-    def fetch_current_reading_as_json(self) -> str:
-        for reading in self.fetch_current_readings():
-            return Service.convert_to_json(reading)
-        return '{}'
+    def fetch_compressed_rows(self, since_ts: int = 0, max_ts: Optional[int] = None) -> list:
+        select: str = ('SELECT day_start, data FROM ReadingCompressed'
+            ' WHERE day_start + 86399 > ?')
+        params = [since_ts]
+        if max_ts is not None:
+            select += ' AND day_start <= ?'
+            params.append(max_ts)
+        select += ' ORDER BY day_start;'
+        with self.lock:
+            cursor = self.conn.cursor()
+            try:
+                pairs = cursor.execute(select, params).fetchall()
+            except sqlite3.OperationalError:
+                # Database predates the ReadingCompressed table.
+                pairs = []
+            cursor.close()
+        rows: list = []
+        for day_start, blob in pairs:
+            columns = loads(zlib.decompress(blob))
+            timestamps = columns['timestamp']
+            field_columns = [columns[field] for field in READING_FIELDS]
+            for i, offset in enumerate(timestamps):
+                timestamp = day_start + offset
+                if timestamp > since_ts and (max_ts is None or timestamp <= max_ts):
+                    rows.append(tuple(column[i] for column in field_columns))
+        return rows
+
+    def fetch_hourly_rows(self, since_ts: int = 0, max_ts: Optional[int] = None) -> list:
+        select: str = ('SELECT %s FROM ReadingHourly'
+            ' WHERE record_type = ? AND timestamp > ?') % ', '.join(READING_FIELDS)
+        params = [RecordType.ARCHIVE, since_ts]
+        if max_ts is not None:
+            select += ' AND timestamp <= ?'
+            params.append(max_ts)
+        select += ' ORDER BY timestamp;'
+        with self.lock:
+            cursor = self.conn.cursor()
+            try:
+                rows = cursor.execute(select, params).fetchall()
+            except sqlite3.OperationalError:
+                # Database predates the ReadingHourly table.
+                rows = []
+            cursor.close()
+        return rows
 
-    def get_earliest_timestamp_as_json(self) -> str:
-        select: str = ('SELECT timestamp FROM Reading WHERE record_type = %d'
-            ' ORDER BY timestamp LIMIT 1') % RecordType.ARCHIVE
-        log.debug('get-earliest-timestamp: select: %s' % select)
+    def fetch_current_readings(self) -> Iterator[Reading]:
+        # The current reading is stored at timestamp 0.
+        return self.fetch_readings(RecordType.CURRENT, -1)
+
+    def fetch_current_reading_as_json(self) -> bytes:
+        # Clients may poll faster than the sensor updates; when the
+        # stored reading hasn't changed, serve the cached serialization.
+        # The ts probe (rather than trusting the cache blindly) keeps
+        # this correct even though the monitor writes through a separate
+        # Database instance in another process.
+        with self.lock:
+            cursor = self.conn.cursor()
+            row = cursor.execute(CURRENT_TS_SQL).fetchone()
+            cursor.close()
+        if row is None:
+            return b'{}'
+        ts, payload = self.current_json_cache
+        if row[0] == ts and payload:
+            return payload
+        for reading in self.fetch_current_readings():
+            payload = Service.convert_to_json(reading).encode('utf-8')
+            self.current_json_cache = (reading.ts, payload)
+            return payload
+        return b'{}'
+
+    def get_earliest_timestamp_as_json(self) -> bytes:
+        select: str = ('SELECT timestamp FROM Reading WHERE record_type = ?'
+            ' ORDER BY timestamp LIMIT 1')
+        log.debug('get-earliest-timestamp: select: %s', select)
         resp = {}
-        with sqlite3.connect(self.db_file, timeout=10) as conn:
-            cursor = conn.cursor()
-            for row in cursor.execute(select):
-                log.debug('get-earliest-timestamp: returned %s' % row[0])
+        with self.lock:
+            cursor = self.conn.cursor()
+            for row in cursor.execute(select, (RecordType.ARCHIVE,)):
+                log.debug('get-earliest-timestamp: returned %s', row[0])
                 resp['timestamp'] = row[0]
                 break
-        log.debug('get-earliest-timestamp: returning: %s' % dumps(resp))
-        return dumps(resp)
+            # The oldest history may live in the hourly or packed tiers
+            # rather than a raw row; for a packed day, its first offset
+            # is the day's first timestamp.
+            try:
+                hourly = cursor.execute(
+                    'SELECT timestamp FROM ReadingHourly WHERE record_type = ?'
+                    ' ORDER BY timestamp LIMIT 1;', (RecordType.ARCHIVE,)).fetchone()
+            except sqlite3.OperationalError:
+                # Database predates the ReadingHourly table.
+                hourly = None
+            try:
+                pair = cursor.execute(
+                    'SELECT day_start, data FROM ReadingCompressed'
+                    ' ORDER BY day_start LIMIT 1;').fetchone()
+            except sqlite3.OperationalError:
+                # Database predates the ReadingCompressed table.
+                pair = None
+            cursor.close()
+        if hourly is not None:
+            if 'timestamp' not in resp or hourly[0] < resp['timestamp']:
+                resp['timestamp'] = hourly[0]
+        if pair is not None:
+            day_start, blob = pair
+            offsets = loads(zlib.decompress(blob))['timestamp']
+            if offsets:
+                earliest = day_start + offsets[0]
+                if 'timestamp' not in resp or earliest < resp['timestamp']:
+                    resp['timestamp'] = earliest
+        if log.debug_mode:
+            log.debug('get-earliest-timestamp: returning: %s', dumps(resp))
+        return dumps_bytes(resp)
 
     def fetch_archive_readings(self, since_ts: int = 0, max_ts: Optional[int] = None, limit: Optional[int] = None) -> Iterator[Reading]:
         return self.fetch_readings(RecordType.ARCHIVE, since_ts, max_ts, limit)
 
-    def fetch_archive_readings_as_json(self, since_ts: int = 0, max_ts: Optional[int] = None, limit: Optional[int] = None) -> str:
-        contents = ''
-        for reading in self.fetch_archive_readings(since_ts, max_ts, limit):
-            if contents != '':
-                contents += ','
-            contents += Service.convert_to_json(reading)
-        return '[  %s ]' % contents
+    def fetch_archive_readings_as_json(self, since_ts: int = 0, max_ts: Optional[int] = None, limit: Optional[int] = None) -> bytes:
+        # Serialize straight from the fetched rows: a dict per record and
+        # a single dumps call, rather than materializing a Reading and
+        # running convert_to_json row by row.
+        records = []
+        for row in self.fetch_rows(RecordType.ARCHIVE, since_ts, max_ts, limit):
+            data: Dict[str, Any] = dict(zip(READING_FIELDS[:3], row[:3]))
+            data['conditions'] = [dict(zip(READING_FIELDS[3:], row[3:]))]
+            records.append({'data': data, 'error': None})
+        return dumps_bytes(records)
 
     def fetch_readings(self, record_type: int, since_ts: int = 0, max_ts: Optional[int] = None, limit: Optional[int] = None) -> Iterator[Reading]:
-        select: str = ('SELECT did, name, ts, lsid, data_structure_type,'
-            ' temp, hum, dew_point, wet_bulb, heat_index,'
-            ' pm_1_last, pm_2p5_last, pm_10_last,'
-            ' pm_1,'
-            ' pm_2p5, pm_2p5_last_1_hour, pm_2p5_last_3_hours, pm_2p5_last_24_hours, pm_2p5_nowcast,'
-            ' pm_10, pm_10_last_1_hour, pm_10_last_3_hours, pm_10_last_24_hours, pm_10_nowcast,'
-            ' last_report_time, pct_pm_data_last_1_hour, pct_pm_data_last_3_hours,'
-            ' pct_pm_data_nowcast, pct_pm_data_last_24_hours FROM Reading'
-            ' WHERE record_type = %d AND timestamp > %d') % (record_type, since_ts)
+        for row in self.fetch_rows(record_type, since_ts, max_ts, limit):
+            yield Database.create_reading_from_row(row)
+
+    def fetch_rows(self, record_type: int, since_ts: int = 0, max_ts: Optional[int] = None, limit: Optional[int] = None) -> list:
+        # Only the column list is formatted in; the values are bound, so
+        # SQLite can reuse the cached prepared statement across calls.
+        select: str = ('SELECT %s FROM Reading'
+            ' WHERE record_type = ? AND timestamp > ?') % ', '.join(READING_FIELDS)
+        params = [record_type, since_ts]
         if max_ts is not None:
-            select = '%s AND timestamp <= %d' % (select, max_ts)
+            select += ' AND timestamp <= ?'
+            params.append(max_ts)
         select += ' ORDER BY timestamp'
         if limit is not None:
-            select = '%s LIMIT %d' % (select, limit)
+            select += ' LIMIT ?'
+            params.append(limit)
         select += ';'
-        log.debug('fetch_readings: select: %s' % select)
-        with sqlite3.connect(self.db_file, timeout=10) as conn:
-            cursor = conn.cursor()
-            for row in cursor.execute(select):
-                reading = Database.create_reading_from_row(row)
-                yield reading
+        log.debug('fetch_rows: select: %s %r', select, params)
+        # Fetch all rows while the lock is held so the connection is free
+        # for other threads as soon as possible.
+        with self.lock:
+            cursor = self.conn.cursor()
+            rows = cursor.execute(select, params).fetchall()
+            cursor.close()
+        if record_type == RecordType.ARCHIVE:
+            # Hourly downsamples and compressed days are both strictly
+            # older than any raw row (their source rows are deleted when
+            # folded or packed), so prepending keeps the result ordered
+            # by timestamp.  The two older tiers are sorted against each
+            # other on the reading ts in case both are populated.
+            older = (self.fetch_hourly_rows(since_ts, max_ts)
+                     + self.fetch_compressed_rows(since_ts, max_ts))
+            if older:
+                older.sort(key=operator.itemgetter(2))  # READING_FIELDS[2] is ts
+                rows = older + rows
+                if limit is not None:
+                    rows = rows[:limit]
+        return rows
 
     @staticmethod
     def create_reading_from_row(row) -> Reading:
-        return Reading(
-            did                       = row[0],
-            name                      = row[1],
-            ts                        = row[2],
-            lsid                      = row[3],
-            data_structure_type       = row[4],
-            temp                      = row[5],
-            hum                       = row[6],
-            dew_point                 = row[7],
-            wet_bulb                  = row[8],
-            heat_index                = row[9],
-            pm_1_last                 = row[10],
-            pm_2p5_last               = row[11],
-            pm_10_last                = row[12],
-            pm_1                      = row[13],
-            pm_2p5                    = row[14],
-            pm_2p5_last_1_hour        = row[15],
-            pm_2p5_last_3_hours       = row[16],
-            pm_2p5_last_24_hours      = row[17],
-            pm_2p5_nowcast            = row[18],
-            pm_10                     = row[19],
-            pm_10_last_1_hour         = row[20],
-            pm_10_last_3_hours        = row[21],
-            pm_10_last_24_hours       = row[22],
-            pm_10_nowcast             = row[23],
-            last_report_time          = row[24],
-            pct_pm_data_last_1_hour   = row[25],
-            pct_pm_data_last_3_hours  = row[26],
-            pct_pm_data_nowcast       = row[27],
-            pct_pm_data_last_24_hours = row[28])
+        # The SELECT in fetch_readings lists the columns in Reading field
+        # declaration order, so the row can be applied positionally.
+        return Reading(*row)
 
 class Service(object):
     def __init__(self, hostname: str, port: int, timeout_secs: int,
-                 database: Database) -> None:
+                 database: Database, retention_days: int = 0,
+                 compress_after_days: int = 0) -> None:
         self.hostname = hostname
         self.port = port
         self.timeout_secs    = timeout_secs
@@ -371,6 +612,13 @@ class Service(object):
         self.pollfreq_offset = 5
         self.arcint_secs     = 60
         self.database        = database
+        # Archive readings older than retention_days are downsampled to
+        # hourly records once a day (0 keeps raw readings forever).
+        self.retention_days  = retention_days
+        # Whole days of archive readings older than compress_after_days
+        # are packed into compressed blobs once a day (0 disables).
+        self.compress_after_days = compress_after_days
+        self.last_maintenance_day: Optional[int] = None
 
         log.debug('Service created')
 
@@ -386,10 +634,10 @@ class Service(object):
         for i in range(3):
             try:
                 start_time = time.time()
-                r: requests.Response = session.get(url="http://%s:%s/v1/current_conditions" % (hostname, port), timeout=timeout_secs)
+                r: requests.Response = session.get(url, timeout=timeout_secs)
                 r.raise_for_status()
                 elapsed_time = time.time() - start_time
-                log.debug('collect_data: elapsed time: %f seconds.' % elapsed_time)
+                log.debug('collect_data: elapsed time: %f seconds.', elapsed_time)
                 if elapsed_time > 5:
                     log.info('Event took longer than expected: %f seconds.' % elapsed_time)
                 break
@@ -403,8 +651,8 @@ class Service(object):
         try:
             if r:
                 # convert to json
-                j = r.json()
-                log.debug('collect_data: json returned from %s is: %r' % (hostname, j))
+                j = loads(r.content)
+                log.debug('collect_data: json returned from %s is: %r', hostname, j)
                 # Check for error
                 if 'error' in j and j['error'] is not None:
                     error = j['error']
@@ -412,15 +660,17 @@ class Service(object):
                     message = error['message']
                     log.info('%s returned error(%d): %s' % (url, code, message))
                     return None
-                # If data structure type 5, convert it to 6.
-                if j['data']['conditions'][0]['data_structure_type'] == 5:
+                # If data structure type 5, convert it to 6.  The
+                # converter renames keys in place, so cond stays valid.
+                cond = j['data']['conditions'][0]
+                if cond['data_structure_type'] == 5:
                     Service.convert_data_structure_type_5_to_6(j)
                 # Check for sanity
                 sane, msg = Service.is_sane(j)
                 if not sane:
                     log.info('Reading not sane:  %s (%s)' % (msg, j))
                     return None
-                time_of_reading = j['data']['conditions'][0]['last_report_time']
+                time_of_reading = cond['last_report_time']
                 # The reading could be old.
                 # Check that it's not older than now - 60
                 age_of_reading = time.time() - time_of_reading
@@ -429,7 +679,7 @@ class Service(object):
                     # will be seconds from boot time (until the device syncs
                     # time.  Check for this by checking if concentrations.pm_1
                     # is None.
-                    if j['data']['conditions'][0]['pm_1'] is None:
+                    if cond['pm_1'] is None:
                         log.info('last_report_time must be time since boot: %d seconds.  Record: %s'
                                  % (time_of_reading, j))
                     else:
@@ -459,103 +709,38 @@ class Service(object):
             return None
     
         # Create a Reading
-        log.debug('Successful read from %s.' % hostname)
+        log.debug('Successful read from %s.', hostname)
         return Service.populate_record(time_of_reading, j)
     
     @staticmethod
     def populate_record(ts, j) -> Reading:
-        record = dict()
-    
-        # put items into record
+        data = j['data']
+        cond = data['conditions'][0]
+
+        # Fast path: a sane reading normally has every key, and the two
+        # itemgetters fetch them all in two C-level calls.
+        try:
+            return Reading(*DATA_GET(data), *COND_GET(cond))
+        except KeyError:
+            pass
+
+        # Slow path: fill in every Reading field, tracking fields the
+        # sensor didn't report.  The first three fields come from the
+        # data object, the rest from conditions[0].
+        record: Dict[str, Any] = {}
         missed = []
-    
-        def get_and_update_missed_data(key):
-            if key in j['data']:
-                return j['data'][key]
-            else:
-                missed.append(key)
-                return None
-    
-        def get_and_update_missed_data_conditions(key):
-            if key in j['data']['conditions'][0]:
-                return j['data']['conditions'][0][key]
-            else:
-                missed.append(key)
-                return None
-
-        record['did'] = get_and_update_missed_data('did')
-        record['name'] = get_and_update_missed_data('name')
-        record['ts'] = get_and_update_missed_data('ts')
-
-        record['lsid'] = get_and_update_missed_data_conditions('lsid')
-        record['data_structure_type'] = get_and_update_missed_data_conditions('data_structure_type')
-        record['last_report_time'] = get_and_update_missed_data_conditions('last_report_time')
-
-        record['temp'] = get_and_update_missed_data_conditions('temp')
-        record['hum'] = get_and_update_missed_data_conditions('hum')
-        record['dew_point'] = get_and_update_missed_data_conditions('dew_point')
-        record['wet_bulb'] = get_and_update_missed_data_conditions('wet_bulb')
-        record['heat_index'] = get_and_update_missed_data_conditions('heat_index')
-
-        record['pct_pm_data_last_1_hour'] = get_and_update_missed_data_conditions('pct_pm_data_last_1_hour')
-        record['pct_pm_data_last_3_hours'] = get_and_update_missed_data_conditions('pct_pm_data_last_3_hours')
-        record['pct_pm_data_nowcast'] = get_and_update_missed_data_conditions('pct_pm_data_nowcast')
-        record['pct_pm_data_last_24_hours'] = get_and_update_missed_data_conditions('pct_pm_data_last_24_hours')
-    
-        record['pm1_0'] = get_and_update_missed_data_conditions('pm_1_last')
-        record['pm2_5'] = get_and_update_missed_data_conditions('pm_2p5_last')
-        record['pm10_0'] = get_and_update_missed_data_conditions('pm_10_last')
-    
-        # Copy in all of the concentrations.
-        record['pm_1'] = get_and_update_missed_data_conditions('pm_1')
-        record['pm_1_last'] = get_and_update_missed_data_conditions('pm_1_last')
-        for prefix in ['pm_2p5', 'pm_10']:
-            key = prefix + '_last'
-            record[key] = get_and_update_missed_data_conditions(key)
-            key = prefix
-            record[key] = get_and_update_missed_data_conditions(key)
-            key = prefix + '_last_1_hour'
-            record[key] = get_and_update_missed_data_conditions(key)
-            key = prefix + '_last_3_hours'
-            record[key] = get_and_update_missed_data_conditions(key)
-            key = prefix + '_last_24_hours'
-            record[key] = get_and_update_missed_data_conditions(key)
-            key = prefix + '_nowcast'
-            record[key] = get_and_update_missed_data_conditions(key)
-    
+        for source, keys in ((data, READING_FIELDS[:3]), (cond, READING_FIELDS[3:])):
+            for key in keys:
+                value = source.get(key, MISSING)
+                if value is MISSING:
+                    missed.append(key)
+                    value = None
+                record[key] = value
+
         if missed:
             log.info("Sensor didn't report field(s): %s" % ','.join(missed))
 
-        return Reading(
-            did                       = record['did'],
-            name                      = record['name'],
-            ts                        = record['ts'],
-            lsid                      = record['lsid'],
-            data_structure_type       = record['data_structure_type'],
-            temp                      = record['temp'],
-            hum                       = record['hum'],
-            dew_point                 = record['dew_point'],
-            wet_bulb                  = record['wet_bulb'],
-            heat_index                = record['heat_index'],
-            pm_1_last                 = record['pm_1_last'],
-            pm_2p5_last               = record['pm_2p5_last'],
-            pm_10_last                = record['pm_10_last'],
-            pm_1                      = record['pm_1'],
-            pm_2p5                    = record['pm_2p5'],
-            pm_2p5_last_1_hour        = record['pm_2p5_last_1_hour'],
-            pm_2p5_last_3_hours       = record['pm_2p5_last_3_hours'],
-            pm_2p5_last_24_hours      = record['pm_2p5_last_24_hours'],
-            pm_2p5_nowcast            = record['pm_2p5_nowcast'],
-            pm_10                     = record['pm_10'],
-            pm_10_last_1_hour         = record['pm_10_last_1_hour'],
-            pm_10_last_3_hours        = record['pm_10_last_3_hours'],
-            pm_10_last_24_hours       = record['pm_10_last_24_hours'],
-            pm_10_nowcast             = record['pm_10_nowcast'],
-            last_report_time          = record['last_report_time'],
-            pct_pm_data_last_1_hour   = record['pct_pm_data_last_1_hour'],
-            pct_pm_data_last_3_hours  = record['pct_pm_data_last_3_hours'],
-            pct_pm_data_nowcast       = record['pct_pm_data_nowcast'],
-            pct_pm_data_last_24_hours = record['pct_pm_data_last_24_hours'])
+        return Reading(**record)
 
     @staticmethod
     def datetime_display(ts: int) -> str:
@@ -563,62 +748,32 @@ class Service(object):
 
     @staticmethod
     def convert_to_json(reading: Reading) -> str:
-        data: Dict[str, Any] = {
-            'did'                      : reading.did,
-            'name'                     : reading.name,
-            'ts'                       : reading.ts}
-        condition_0: Dict[str, Any] = {
-            'lsid'                     : reading.lsid,
-            'data_structure_type'      : reading.data_structure_type,
-            'temp'                     : reading.temp,
-            'hum'                      : reading.hum,
-            'dew_point'                : reading.dew_point,
-            'wet_bulb'                 : reading.wet_bulb,
-            'heat_index'               : reading.heat_index,
-            'pm_1_last'                : reading.pm_1_last,
-            'pm_2p5_last'              : reading.pm_2p5_last,
-            'pm_10_last'               : reading.pm_10_last,
-            'pm_1'                     : reading.pm_1,
-            'pm_2p5'                   : reading.pm_2p5,
-            'pm_2p5_last_1_hour'       : reading.pm_2p5_last_1_hour,
-            'pm_2p5_last_3_hours'      : reading.pm_2p5_last_3_hours,
-            'pm_2p5_last_24_hours'     : reading.pm_2p5_last_24_hours,
-            'pm_2p5_nowcast'           : reading.pm_2p5_nowcast,
-            'pm_10'                    : reading.pm_10,
-            'pm_10_last_1_hour'        : reading.pm_10_last_1_hour,
-            'pm_10_last_3_hours'       : reading.pm_10_last_3_hours,
-            'pm_10_last_24_hours'      : reading.pm_10_last_24_hours,
-            'pm_10_nowcast'            : reading.pm_10_nowcast,
-            'last_report_time'         : reading.last_report_time,
-            'pct_pm_data_last_1_hour'  : reading.pct_pm_data_last_1_hour,
-            'pct_pm_data_last_3_hours' : reading.pct_pm_data_last_3_hours,
-            'pct_pm_data_nowcast'      : reading.pct_pm_data_nowcast,
-            'pct_pm_data_last_24_hours': reading.pct_pm_data_last_24_hours}
-        data['conditions'] = [ condition_0 ]
+        values: Tuple = READING_ATTRS(reading)
+        data: Dict[str, Any] = dict(zip(READING_FIELDS[:3], values[:3]))
+        data['conditions'] = [ dict(zip(READING_FIELDS[3:], values[3:])) ]
         reading_dict: Dict[str, Any] = { 'data': data, 'error': None }
 
         return dumps(reading_dict)
 
     @staticmethod
     def utc_now() -> datetime:
-        return datetime.now(tz=tz.gettz('UTC'))
+        return datetime.now(timezone.utc)
 
     @staticmethod
     def convert_data_structure_type_5_to_6(j: Dict[str, Any]) -> None:
-        # Fix up these names and change data_structure_type to 6
+        # Rename the pm_10p0* keys in place and change data_structure_type
+        # to 6.  pop renames in one step; nothing downstream looks at the
+        # old names, so there is no need to None them out.
         try:
-            j['data']['conditions'][0]['pm_10'] = j['data']['conditions'][0]['pm_10p0']
-            j['data']['conditions'][0]['pm_10p0'] = None
-            j['data']['conditions'][0]['pm_10_last_1_hour'] = j['data']['conditions'][0]['pm_10p0_last_1_hour']
-            j['data']['conditions'][0]['pm_10p0_last_1_hour'] = None
-            j['data']['conditions'][0]['pm_10_last_3_hours'] = j['data']['conditions'][0]['pm_10p0_last_3_hours']
-            j['data']['conditions'][0]['pm_10p0_last_3_hours'] = None
-            j['data']['conditions'][0]['pm_10_last_24_hours'] = j['data']['conditions'][0]['pm_10p0_last_24_hours']
-            j['data']['conditions'][0]['pm_10p0_last_24_hours'] = None
-            j['data']['conditions'][0]['pm_10_nowcast'] = j['data']['conditions'][0]['pm_10p0_nowcast']
-            j['data']['conditions'][0]['pm_10p0_nowcast'] = None
-    
-            j['data']['conditions'][0]['data_structure_type'] = 6
+            cond = j['data']['conditions'][0]
+            for old, new in (('pm_10p0',               'pm_10'),
+                             ('pm_10p0_last_1_hour',   'pm_10_last_1_hour'),
+                             ('pm_10p0_last_3_hours',  'pm_10_last_3_hours'),
+                             ('pm_10p0_last_24_hours', 'pm_10_last_24_hours'),
+                             ('pm_10p0_nowcast',       'pm_10_nowcast')):
+                cond[new] = cond.pop(old)
+
+            cond['data_structure_type'] = 6
             log.debug('Converted type 5 record to type 6.')
         except Exception as e:
             log.info('convert_data_structure_type_5_to_6: exception: %s' % e)
@@ -626,102 +781,110 @@ class Service(object):
 
     @staticmethod
     def is_type(j: Dict[str, Any], t, name: str, none_ok: bool = False) -> bool:
-        try:
-            x = j[name]
-            if x is None and none_ok:
-                return True
-            if not isinstance(x, t):
-                log.debug('%s is not an instance of %s: %s' % (name, t, j[name]))
-                return False
-            return True
-        except KeyError as e:
-            log.debug('is_type: could not find key: %s' % e)
-            return False
-        except Exception as e:
-            log.debug('is_type: exception: %s' % e)
+        # dict.get with a sentinel avoids raising/catching KeyError on the
+        # missing-key path, and the exact type compare is a pointer check
+        # (it also rejects bools, which isinstance(x, int) would accept).
+        x = j.get(name, MISSING)
+        if x is MISSING:
+            log.debug('is_type: could not find key: %s', name)
             return False
+        if x is None:
+            return none_ok
+        if type(x) is t or (type(t) is tuple and type(x) in t):
+            return True
+        log.debug('%s is not an instance of %s: %s', name, t, x)
+        return False
     
     @staticmethod
     def is_sane(j: Dict[str, Any]) -> Tuple[bool, str]:
         if j['error'] is not None:
             return False, 'Error: %s' % j['error']
-    
+
         if not Service.is_type(j, dict, 'data'):
             return False, 'Missing or malformed "data" field'
-    
-        if not Service.is_type(j['data'], str, 'name'):
+        data = j['data']
+
+        if not Service.is_type(data, str, 'name'):
             return False, 'Missing or malformed "name" field'
-    
-        if not Service.is_type(j['data'], int, 'ts'):
+
+        if not Service.is_type(data, int, 'ts'):
             return False, 'Missing or malformed "ts" field'
-    
-        if not Service.is_type(j['data'], list, 'conditions'):
+
+        if not Service.is_type(data, list, 'conditions'):
             return False, 'Missing or malformed "conditions" field'
-    
-        if len(j['data']['conditions']) == 0:
+
+        if len(data['conditions']) == 0:
             return False, 'Expected one element in conditions array.'
-    
-        if not Service.is_type(j['data']['conditions'][0], int, 'data_structure_type'):
+        cond = data['conditions'][0]
+
+        if not Service.is_type(cond, int, 'data_structure_type'):
             return False, 'Missing or malformed "data_structure_type" field'
-    
-        if j['data']['conditions'][0]['data_structure_type'] != 6:
+
+        if cond['data_structure_type'] != 6:
             return False, 'Expected data_structure_type of 6 (or type 5 auto converted to 6.'
-    
-        for name in ['pm_1_last', 'pm_2p5_last', 'pm_10_last', 'last_report_time',
-                'pct_pm_data_last_1_hour', 'pct_pm_data_last_3_hours',
-                'pct_pm_data_nowcast', 'pct_pm_data_last_24_hours']:
-            if not Service.is_type(j['data']['conditions'][0], int, name, True):
-                return False, 'Missing or malformed "%s" field' % name
-    
-        if not Service.is_type(j['data']['conditions'][0], int, 'lsid', True):
-            return False, 'Missing or malformed "lsid" field'
-    
-        for name in ['temp', 'hum', 'dew_point', 'wet_bulb', 'heat_index']:
-            if not Service.is_type(j['data']['conditions'][0], float, name):
+
+        for name, t, none_ok in SANE_CONDITION_FIELDS:
+            value = cond.get(name, MISSING)
+            if value is MISSING:
                 return False, 'Missing or malformed "%s" field' % name
-    
-        for name in ['pm_1', 'pm_2p5', 'pm_2p5_last_1_hour',
-                 'pm_2p5_last_3_hours', 'pm_2p5_last_24_hours', 'pm_2p5_nowcast',
-                 'pm_10', 'pm_10_last_1_hour', 'pm_10_last_3_hours',
-                 'pm_10_last_24_hours', 'pm_10_nowcast']:
-            if not Service.is_type(j['data']['conditions'][0], float, name, True):
+            if value is None:
+                if not none_ok:
+                    return False, 'Missing or malformed "%s" field' % name
+            elif not isinstance(value, t):
                 return False, 'Missing or malformed "%s" field' % name
-    
-        return True, ''
 
-    def compute_next_event(self, first_time: bool) -> Tuple[Event, float]:
-        now = time.time()
-        next_poll_event = int(now / self.pollfreq_secs) * self.pollfreq_secs + self.pollfreq_secs
-        log.debug('next_poll_event: %f' % next_poll_event)
-        next_arc_event = int((now - self.pollfreq_offset) / self.arcint_secs) * self.arcint_secs + self.arcint_secs + self.pollfreq_offset
-        log.debug('next_arc_event: %f' % next_arc_event)
-        event = Event.ARCHIVE if next_poll_event == next_arc_event else Event.POLL
-        secs_to_event = next_poll_event - now
-        log.debug('Next event: %r in %f seconds' % (event, secs_to_event))
-        return event, secs_to_event
+        return True, ''
 
     def do_loop(self) -> None:
-        first_time: bool = True
         log.debug('Started main loop.')
         session: Optional[requests.Session] = None
+        # Align the first tick to the next poll boundary on the wall
+        # clock, then advance a monotonic deadline per tick.  The
+        # monotonic clock is immune to NTP steps, so an adjustment can
+        # neither double-poll nor skip a poll.  Wall-clock time is still
+        # used for the archive timestamps written to the database.
+        now = time.time()
+        next_poll_wall: int = int(now / self.pollfreq_secs) * self.pollfreq_secs + self.pollfreq_secs
+        next_poll_mono: float = time.monotonic() + (next_poll_wall - now)
+        archive_offset: int = self.pollfreq_offset % self.arcint_secs
         while True:
             # sleep until next event
-            event, secs_to_event = self.compute_next_event(first_time)
-            first_time = False
-            sleep(secs_to_event)
+            sleep(max(0.0, next_poll_mono - time.monotonic()))
+            event = (Event.ARCHIVE
+                     if next_poll_wall % self.arcint_secs == archive_offset
+                     else Event.POLL)
+            log.debug('Event: %r at %d', event, next_poll_wall)
+            next_poll_wall += self.pollfreq_secs
+            next_poll_mono += self.pollfreq_secs
+            behind = time.monotonic() - next_poll_mono
+            if behind > 0:
+                # Fell behind (e.g. a slow sensor read); skip the missed ticks.
+                missed = int(behind / self.pollfreq_secs) + 1
+                next_poll_wall += missed * self.pollfreq_secs
+                next_poll_mono += missed * self.pollfreq_secs
 
             # Write a reading and possibly write an archive record.
+            # Timing brackets only feed log.debug, so skip the clock
+            # reads entirely when debug is off.
+            debug_mode = log.debug_mode
             reading: Optional[Reading] = None
             try:
-                start = Service.utc_now()
+                start = time.perf_counter() if debug_mode else 0.0
                 if session is None:
-                    session= requests.Session()
+                    session = requests.Session()
+                    # Pin a small pool of keep-alive connections to the
+                    # sensor so each poll reuses the TCP connection
+                    # instead of paying a fresh handshake.
+                    session.headers['Connection'] = 'keep-alive'
+                    session.mount('http://', HTTPAdapter(
+                        pool_connections=1, pool_maxsize=2, max_retries=0))
 
                 reading = Service.collect_data(session, self.hostname, self.port, self.timeout_secs)
-                log.debug('Read sensor in %d seconds.' % (Service.utc_now() - start).seconds)
-            except Exception as e:
+                if debug_mode:
+                    log.debug('Read sensor in %.3f seconds.', time.perf_counter() - start)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
                 log.error('Skipping reading because of: %s' % e)
-                # It's probably a good idea to reset the session
+                # The connection is suspect; reset the session.
                 try:
                     if session is not None:
                         session.close()
@@ -731,6 +894,12 @@ class Service(object):
                     session = None
                 if reading is None and event == event.ARCHIVE:
                     log.error('Skipping archive record.')
+            except Exception as e:
+                # Parse and data errors don't invalidate the connection;
+                # keep the session so its pooled connection survives.
+                log.error('Skipping reading because of: %s' % e)
+                if reading is None and event == event.ARCHIVE:
+                    log.error('Skipping archive record.')
 
             # May or may not have a new reading.
             if reading is not None:
@@ -739,20 +908,51 @@ class Service(object):
                     # running a few seconds early.
                     archive_ts = int((time.time() + 5) / self.arcint_secs) * self.arcint_secs
                 try:
-                    start = Service.utc_now()
-                    self.database.save_current_reading(reading)
-                    log.debug('Saved current reading in %d seconds.' % (Service.utc_now() - start).seconds)
-                    log.debug('Saved current reading %s to database.' % Service.datetime_display(reading.last_report_time))
+                    start = time.perf_counter() if debug_mode else 0.0
+                    # One transaction (and hence one fsync) covers the
+                    # current reading and, on archive ticks, the archive
+                    # reading as well.
+                    with self.database.transaction():
+                        self.database.save_current_reading(reading)
+                        if event == event.ARCHIVE:
+                            self.database.save_archive_reading(archive_ts, reading)
+                    if debug_mode:
+                        log.debug('Saved reading(s) in %.3f seconds.', time.perf_counter() - start)
+                        log.debug('Saved current reading %s to database.', Service.datetime_display(reading.last_report_time))
+                    if event == event.ARCHIVE:
+                        log.info('Added record %s to archive.' % Service.datetime_display(archive_ts))
                 except Exception as e:
-                    log.critical('Could not save current reading to database: %s: %s' % (self.database, e))
+                    log.critical('Could not save reading to database: %s: %s' % (self.database, e))
                 if event == event.ARCHIVE:
-                    try:
-                        start = Service.utc_now()
-                        self.database.save_archive_reading(archive_ts, reading)
-                        log.debug('Saved archive reading in %d seconds.' % (Service.utc_now() - start).seconds)
-                        log.info('Added record %s to archive.' % Service.datetime_display(archive_ts))
-                    except Exception as e:
-                        log.critical('Could not save archive reading to database: %s: %s' % (self.database, e))
+                    self.daily_maintenance()
+
+    def daily_maintenance(self) -> None:
+        # Once a day, pack old whole days of raw archive readings into
+        # compressed blobs and fold raw readings older than the
+        # retention period into hourly records.
+        if self.retention_days <= 0 and self.compress_after_days <= 0:
+            return
+        day = int(time.time() / 86400)
+        if day == self.last_maintenance_day:
+            return
+        self.last_maintenance_day = day
+        now = int(time.time())
+        if self.compress_after_days > 0:
+            cutoff = now - self.compress_after_days * 86400
+            try:
+                packed = self.database.compress(cutoff)
+                log.info('Compressed %d day(s) of archive records older than %s.'
+                         % (packed, Service.datetime_display(cutoff)))
+            except Exception as e:
+                log.error('Could not compress archive records: %s' % e)
+        if self.retention_days > 0:
+            cutoff = now - self.retention_days * 86400
+            try:
+                deleted = self.database.downsample(cutoff)
+                log.info('Downsampled %d archive records older than %s.'
+                         % (deleted, Service.datetime_display(cutoff)))
+            except Exception as e:
+                log.error('Could not downsample archive records: %s' % e)
 
 class bcolors:
     HEADER = '\033[95m'
@@ -786,27 +986,35 @@ def collect_two_readings_one_second_apart(hostname: str, port: int, timeout_secs
 
 def run_tests(service_name: str, hostname: str, port: int, timeout_secs: int) -> None:
     reading, reading2 = collect_two_readings_one_second_apart(hostname, port, timeout_secs)
-    test_db_archive_records(service_name, reading)
-    test_db_current_records(service_name, reading, reading2)
+    # The db tests share one throwaway database (one file create and one
+    # schema bootstrap); current and archive records live under separate
+    # record types, so the tests don't step on each other.
+    with fresh_test_db(service_name) as db:
+        test_db_archive_records(db, reading)
+        test_db_current_records(db, reading, reading2)
     sanity_check_reading(reading)
     test_convert_to_json(reading, reading2)
 
 def sanity_check_reading(reading: Optional[Reading]) -> None:
     try:
         print('sanity_check_reading....', end='')
-        now: float = int(time.time())
-        one_minute_ago: int = int(time.time() - 60)
+        now: int = int(time.time())
+        one_minute_ago: int = now - 60
 
         assert reading is not None
         assert reading.did is not None
         assert reading.name is not None
-        assert reading.ts > one_minute_ago and reading.ts < now, 'Reading returned insane time (%r).' % reading.ts
-        assert reading.temp >= 0 and reading.temp <= 100, 'Reading returned insane temperature (%d).' % reading.temp
-        assert reading.hum >= 0 and reading.hum <= 100, 'Reading returned insane humidity (%d).' % reading.hum
-        assert reading.last_report_time > one_minute_ago and reading.last_report_time < now, 'Reading returned insane time (%r).' % reading.last_report_time
-        assert reading.pm_1 >= 0.0 and reading.pm_1 < 10000.0, 'Reading returned insane pm_1: %f' % reading.pm_1
-        assert reading.pm_2p5 >= 0.0 and reading.pm_2p5 < 10000.0, 'Reading returned insane pm_2p5: %f' % reading.pm_2p5
-        assert reading.pm_10 >= 0.0 and reading.pm_10 < 10000.0, 'Reading returned insane pm_10: %f' % reading.pm_10
+        # (value, low, high, name); one loop instead of a branch per field.
+        checks = (
+            (reading.ts,               one_minute_ago, now,     'ts'),
+            (reading.temp,             0,              100,     'temp'),
+            (reading.hum,              0,              100,     'hum'),
+            (reading.last_report_time, one_minute_ago, now,     'last_report_time'),
+            (reading.pm_1,             0.0,            10000.0, 'pm_1'),
+            (reading.pm_2p5,           0.0,            10000.0, 'pm_2p5'),
+            (reading.pm_10,            0.0,            10000.0, 'pm_10'))
+        for value, low, high, name in checks:
+            assert low <= value <= high, 'Reading returned insane %s (%r).' % (name, value)
 
         print_passed()
     except Exception as e:
@@ -847,15 +1055,29 @@ def create_test_reading(dt: datetime) -> Reading:
 def float_eq(v1: float, v2: float) -> bool:
     return abs(v1 - v2) < 0.0001
 
-def test_db_archive_records(service_name: str, reading_in: Optional[Reading]) -> None:
+@contextmanager
+def fresh_test_db(service_name: str) -> Iterator[Database]:
+    tmp_db = tempfile.NamedTemporaryFile(
+        prefix='tmp-test-db-%s.sdb' % service_name, delete=False)
+    tmp_db.close()
+    os.unlink(tmp_db.name)
+    db = Database.create(tmp_db.name)
+    # The database is throwaway, so durability doesn't matter; skip the
+    # fsyncs and keep the journal in memory.
+    cursor = db.conn.cursor()
+    cursor.execute('PRAGMA synchronous=OFF;')
+    cursor.execute('PRAGMA journal_mode=MEMORY;')
+    cursor.close()
+    try:
+        yield db
+    finally:
+        db.close()
+        os.unlink(tmp_db.name)
+
+def test_db_archive_records(db: Database, reading_in: Optional[Reading]) -> None:
     try:
         print('test_db_archive_records....', end='')
         assert reading_in is not None
-        tmp_db = tempfile.NamedTemporaryFile(
-            prefix='tmp-test-db-archive-%s.sdb' % service_name, delete=False)
-        tmp_db.close()
-        os.unlink(tmp_db.name)
-        db = Database.create(tmp_db.name)
         db.save_archive_reading((reading_in.ts + 60) / 60 * 60, reading_in)
         cnt = 0
         for reading_out in db.fetch_archive_readings(0):
@@ -869,17 +1091,10 @@ def test_db_archive_records(service_name: str, reading_in: Optional[Reading]) ->
     except Exception as e:
         print('test_db_archive_records failed: %s' % e)
         raise e
-    finally:
-        os.unlink(tmp_db.name)
 
-def test_db_current_records(service_name: str, reading_in_1: Optional[Reading], reading_in_2: Optional[Reading]) -> None:
+def test_db_current_records(db: Database, reading_in_1: Optional[Reading], reading_in_2: Optional[Reading]) -> None:
     try:
         print('test_db_current_records....', end='')
-        tmp_db = tempfile.NamedTemporaryFile(
-            prefix='tmp-test-db-current-%s.sdb' % service_name, delete=False)
-        tmp_db.close()
-        os.unlink(tmp_db.name)
-        db = Database.create(tmp_db.name)
         db.save_current_reading(reading_in_1)
         db.save_current_reading(reading_in_2)
         cnt = 0
@@ -894,8 +1109,6 @@ def test_db_current_records(service_name: str, reading_in_1: Optional[Reading],
     except Exception as e:
         print('test_db_current_records failed: %s' % e)
         raise e
-    finally:
-        os.unlink(tmp_db.name)
 
 def test_convert_to_json(reading1: Optional[Reading], reading2: Optional[Reading]) -> None:
     try:
@@ -906,13 +1119,14 @@ def test_convert_to_json(reading1: Optional[Reading], reading2: Optional[Reading
         Service.convert_to_json(reading1)
         Service.convert_to_json(reading2)
 
-        tzinfos = {'CST': tz.gettz("UTC")}
-        reading = create_test_reading(parse('2019/12/15T03:43:05UTC', tzinfos=tzinfos))
+        reading = create_test_reading(datetime(2019, 12, 15, 3, 43, 5, tzinfo=timezone.utc))
         json_reading: str = Service.convert_to_json(reading)
 
         expected = '{"data": {"did": "abc", "name": "foo", "ts": 1576381385, "conditions": [{"lsid": 123, "data_structure_type": 6, "temp": 100, "hum": 90, "dew_point": 85, "wet_bulb": 66, "heat_index": 99, "pm_1_last": 1, "pm_2p5_last": 3, "pm_10_last": 10, "pm_1": 1.1, "pm_2p5": 2.5, "pm_2p5_last_1_hour": 2.1, "pm_2p5_last_3_hours": 2.3, "pm_2p5_last_24_hours": 2.24, "pm_2p5_nowcast": 2.22, "pm_10": 10.0, "pm_10_last_1_hour": 10.1, "pm_10_last_3_hours": 10.3, "pm_10_last_24_hours": 10.24, "pm_10_nowcast": 10.101, "last_report_time": 1576381385, "pct_pm_data_last_1_hour": 94, "pct_pm_data_last_3_hours": 97, "pct_pm_data_nowcast": 100, "pct_pm_data_last_24_hours": 76}]}, "error": null}'
 
-        assert json_reading == expected, 'Expected json: %s, found: %s' % (expected, json_reading)
+        # Compare parsed, not raw, as whitespace differs between json
+        # implementations.
+        assert loads(json_reading) == loads(expected), 'Expected json: %s, found: %s' % (expected, json_reading)
         print_passed()
     except Exception as e:
         print_failed(e)
@@ -943,15 +1157,22 @@ class CantOpenConfigFile(Exception):
 class CantParseConfigFile(Exception):
     pass
 
-def get_configuration(config_file):
+def get_configuration(config_file) -> Dict[str, str]:
     try:
-        config_dict = configobj.ConfigObj(config_file, file_error=True, encoding='utf-8')
+        with open(config_file, encoding='utf-8') as f:
+            config_text = f.read()
     except IOError:
         raise CantOpenConfigFile("Unable to open configuration file %s" % config_file)
-    except configobj.ConfigObjError:
-        raise CantParseConfigFile("Error parsing configuration file %s", config_file)
+    # The conf file is section-less key = value pairs; configparser
+    # insists on a section header, so parse under DEFAULT.
+    parser = configparser.ConfigParser(
+        interpolation=None, inline_comment_prefixes=('#',))
+    try:
+        parser.read_string('[DEFAULT]\n' + config_text)
+    except configparser.Error:
+        raise CantParseConfigFile("Error parsing configuration file %s" % config_file)
 
-    return config_dict
+    return dict(parser.defaults())
 
 def start(args):
     usage = """%prog [--help] [--test | --dump] [--pidfile <pidfile>] <airlinkproxy-conf-file>"""
@@ -983,6 +1204,8 @@ def start(args):
     pollfreq_secs  : int            = int(config_dict.get('poll-freq-secs', 5))
     pollfreq_offset: int            = int(config_dict.get('poll-freq-offset', 5))
     arcint_secs    : int            = int(config_dict.get('archive-interval-secs', 60))
+    retention_days : int            = int(config_dict.get('retention-days', 0))
+    compress_days  : int            = int(config_dict.get('compress-after-days', 0))
     db_file        : Optional[str]  = config_dict.get('database-file', None)
 
     global log
@@ -998,6 +1221,8 @@ def start(args):
     log.info('pollfreq_secs  : %d'    % pollfreq_secs)
     log.info('pollfreq_offset: %d'    % pollfreq_offset)
     log.info('arcint_secs    : %d'    % arcint_secs)
+    log.info('retention_days : %d'    % retention_days)
+    log.info('compress_days  : %d'    % compress_days)
     log.info('db_file        : %s'    % db_file)
     log.info('service_name   : %s'    % service_name)
     log.info('pidfile        : %s'    % options.pidfile)
@@ -1035,14 +1260,15 @@ def start(args):
 
     # Create database if it does not yet exist.
     if not os.path.exists(db_file):
-        log.debug('Creating database: %s' % db_file)
+        log.debug('Creating database: %s', db_file)
         database: Database = Database.create(db_file)
     else:
         database: Database = Database(db_file)
 
-    airlinkproxy_service = Service(hostname, port, timeout_secs, database)
+    airlinkproxy_service = Service(hostname, port, timeout_secs, database,
+                                   retention_days, compress_days)
 
-    log.debug('Staring server on port %d.' % server_port)
+    log.debug('Staring server on port %d.', server_port)
     server.server.serve_requests(server_port, db_file)
 
     log.debug('Staring mainloop.')
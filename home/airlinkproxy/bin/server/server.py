@@ -3,6 +3,7 @@
 # Copyright (c) 2020 John A Kline
 # See the file LICENSE for your full rights.
 
+import concurrent.futures
 import http.server
 import socket
 import threading
@@ -12,7 +13,8 @@ import monitor.monitor
 from enum import Enum
 from dataclasses import dataclass
 from json import dumps
-from typing import Dict, List, Optional
+from typing import Dict, Optional, Union
+from urllib.parse import parse_qsl, urlsplit
 
 VERSION = '1'
 
@@ -23,6 +25,23 @@ class RequestType(Enum):
     FETCH_CURRENT_RECORD   = 3
     FETCH_ARCHIVE_RECORDS  = 4
 
+# Precomputed response head: one %-format and one write per response
+# instead of a formatted line per header.  Content-Length lets HTTP/1.1
+# clients keep the connection alive.
+HDR_JSON_OK: bytes = (b'HTTP/1.1 200 OK\r\n'
+    b'Accept: application/json\r\n'
+    b'Content-Type: application/json\r\n'
+    b'Content-Length: %d\r\n'
+    b'\r\n')
+
+# Command dispatch: one hash lookup per request instead of a chain of
+# string comparisons.
+CMD_TABLE: Dict[str, RequestType] = {
+    '/get-version'           : RequestType.GET_VERSION,
+    '/get-earliest-timestamp': RequestType.GET_EARLIEST_TIMESTAMP,
+    '/v1/current_conditions' : RequestType.FETCH_CURRENT_RECORD,
+    '/fetch-archive-records' : RequestType.FETCH_ARCHIVE_RECORDS}
+
 @dataclass
 class Request:
     request_type: RequestType
@@ -34,94 +53,87 @@ class Request:
 
 class Handler(http.server.BaseHTTPRequestHandler):
     """Handle requests in a separate thread."""
+    protocol_version = 'HTTP/1.1'
+
+    # A keep-alive connection holds a pool worker while it waits for the
+    # next request; without a deadline, eight idle clients would pin all
+    # eight workers and starve everyone else.  On timeout the handler
+    # sets close_connection and the worker is reclaimed.
+    timeout = 30
+
     def do_GET(self):
+        # Scanner noise ('GET /') is rejected before any parsing.
+        if self.path in ('/', ''):
+            self.send_error(400)
+            return
         request =  Handler.parse_requestline(self.requestline)
         if request.request_type == RequestType.GET_VERSION:
             self.respond_success(dumps({'version': VERSION}))
         elif request.request_type == RequestType.GET_EARLIEST_TIMESTAMP:
-            self.respond_success(monitor.monitor.Database(db_file).get_earliest_timestamp_as_json())
+            self.respond_success(database.get_earliest_timestamp_as_json())
         elif request.request_type == RequestType.FETCH_CURRENT_RECORD:
-            self.respond_success(monitor.monitor.Database(db_file).fetch_current_reading_as_json())
+            self.respond_success(database.fetch_current_reading_as_json())
         elif request.request_type == RequestType.FETCH_ARCHIVE_RECORDS:
-            self.respond_success(monitor.monitor.Database(db_file).fetch_archive_readings_as_json(request.since_ts, request.max_ts, request.limit))
+            self.respond_success(database.fetch_archive_readings_as_json(request.since_ts, request.max_ts, request.limit))
         else:
             self.respond_error(request.error)
 
-    def respond_success(self, json: str) -> None:
-        self.send_response(200)
-        self.send_header('Accept', 'application/json')
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.encode('ascii'))
+    # Only GET is served; bounce anything else without parsing it.
+    def do_HEAD(self):
+        self.send_error(405)
 
-    def respond_error(self, error: str):
-        self.send_response(200)
-        self.send_header('Accept', 'application/json')
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(('{ error : "%s" }' % error).encode('ascii'))
+    def do_POST(self):
+        self.send_error(405)
 
-    @staticmethod
-    def parse_args(args_in: str) -> Dict[str, str]:
-        args_dict: Dict[str, str] = {}
-        args: List[str] = args_in.split(',')
-        for arg in args:
-            if '=' in arg:
-                key_value: List[str] = arg.split('=')
-                if key_value[0] != '':
-                    args_dict[key_value[0]] = key_value[1]
-        return args_dict
+    def do_PUT(self):
+        self.send_error(405)
+
+    def respond_success(self, json: Union[str, bytes]) -> None:
+        # The Database json methods hand back ready-to-send bytes.
+        if isinstance(json, str):
+            json = json.encode('utf-8')
+        self.log_request(200)
+        self.wfile.write(HDR_JSON_OK % len(json) + json)
+
+    def respond_error(self, error: str):
+        self.respond_success(dumps({'error': error}))
 
     @staticmethod
     def parse_requestline(requestline: str) -> Request:
-        request: str = requestline.split(' ')[1]
-        args: str = ''
-        if '?' in request:
-            cmd = request.split('?')[0]
-            args = request.split('?')[1]
-        else:
-            cmd = request
-        request_type = RequestType.ERROR
+        request: str = requestline.split(' ', 2)[1]
+        parts = urlsplit(request)
+        cmd: str = parts.path
+        args: str = parts.query
         since_ts: Optional[int] = None
         max_ts: Optional[int] = None
         limit: Optional[int] = None
         error: Optional[str] = None
-        if cmd == '/get-version':
-            request_type = RequestType.GET_VERSION
-        elif cmd == '/get-earliest-timestamp':
-            request_type = RequestType.GET_EARLIEST_TIMESTAMP
-        elif cmd == '/v1/current_conditions':
-            request_type = RequestType.FETCH_CURRENT_RECORD
-        elif cmd == '/fetch-archive-records':
-            request_type = RequestType.FETCH_ARCHIVE_RECORDS
-        elif cmd == '/':
-            error = 'A command must be specified.'
-        else:
-            error = 'Unknown command: %s.' % cmd
-        if cmd != RequestType.ERROR:
-            args_dict: Dict[str, str] = Handler.parse_args(args)
-            if request_type == RequestType.FETCH_ARCHIVE_RECORDS:
-                if 'since_ts' in args_dict:
-                    try:
-                        since_ts = int(args_dict['since_ts'])
-                    except Exception:
-                        request_type = RequestType.ERROR
-                        error =  "The since_ts argument must be an integer, found: '%s'." % args_dict['since_ts']
+        request_type: RequestType = CMD_TABLE.get(cmd, RequestType.ERROR)
+        if request_type == RequestType.ERROR:
+            if cmd == '/':
+                error = 'A command must be specified.'
+            else:
+                error = 'Unknown command: %s.' % cmd
+        elif request_type == RequestType.FETCH_ARCHIVE_RECORDS:
+            # The arguments are comma separated (see README), hence the
+            # non-default separator.
+            args_dict: Dict[str, str] = dict(parse_qsl(args, separator=','))
+            if 'since_ts' in args_dict:
+                arg = 'since_ts'
+                try:
+                    since_ts = int(args_dict['since_ts'])
                     if 'max_ts' in args_dict:
-                        try:
-                            max_ts = int(args_dict['max_ts'])
-                        except Exception:
-                            request_type = RequestType.ERROR
-                            error =  "The max_ts argument must be an integer, found: '%s'." % args_dict['max_ts']
+                        arg = 'max_ts'
+                        max_ts = int(args_dict['max_ts'])
                     if 'limit' in args_dict:
-                        try:
-                            limit = int(args_dict['limit'])
-                        except Exception:
-                            request_type = RequestType.ERROR
-                            error =  "The limit argument must be an integer, found: '%s'." % args_dict['limit']
-                else:
+                        arg = 'limit'
+                        limit = int(args_dict['limit'])
+                except Exception:
                     request_type = RequestType.ERROR
-                    error =  'fetch-archive-records requires since_ts argument'
+                    error =  "The %s argument must be an integer, found: '%s'." % (arg, args_dict[arg])
+            else:
+                request_type = RequestType.ERROR
+                error =  'fetch-archive-records requires since_ts argument'
         return Request(
             request_type = request_type,
             since_ts     = since_ts,
@@ -130,17 +142,30 @@ class Handler(http.server.BaseHTTPRequestHandler):
             error        = error,
             request      = request)
 
-db_file: Optional[str] = None
+# One Database (and hence one sqlite connection) is shared by all
+# request threads; Database serializes access to it internally, and
+# constructing one per request would pay the sqlite open cost every hit.
+database: Optional['monitor.monitor.Database'] = None
 
 def start_server(port: int):
-    class ThreadingHTTPServer6(http.server.ThreadingHTTPServer):
+    class PooledHTTPServer6(http.server.ThreadingHTTPServer):
         address_family = socket.AF_INET6
-    with ThreadingHTTPServer6(('::', port), Handler) as server:
+
+        # Serve requests from a small bounded pool instead of spawning a
+        # fresh thread per request; the pool also caps how many
+        # concurrent handlers can contend for the database.
+        pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix='airlinkproxy_http')
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+    with PooledHTTPServer6(('::', port), Handler) as server:
         server.serve_forever()
 
 def serve_requests(port: int, db_file_in: str):
-    global db_file
-    db_file = db_file_in
+    global database
+    database = monitor.monitor.Database(db_file_in)
     daemon = threading.Thread(name='airlinkproxy_daemon_server',
                               target=start_server,
                               args=[port])